@@ -1,10 +1,16 @@
 """ Implements Menu and Option class """
 
+import cProfile
+import io
 import os
 import platform
+import pstats
+import shutil
+import signal
 import sys
 import subprocess
 import textwrap
+import time
 
 
 getch = input # default, overwrite it below if possible.
@@ -36,7 +42,53 @@ def clear_screen():
   return subprocess.call(command, shell=True)
 
 
-def print2(*s, sep=" ", end="\n", file=sys.stdout, flush=True, n=60, spaces=0):
+_TERMINAL_SIZE = None      # (columns, lines), forgotten on every SIGWINCH
+_SIGWINCH_WATCHED = False  # True once _on_sigwinch has been installed
+_PREV_SIGWINCH = None      # Whatever handler was installed before ours
+
+
+def _on_sigwinch(signum, frame):
+  """ Forgets the cached terminal size and chains to any previous handler """
+  global _TERMINAL_SIZE
+  _TERMINAL_SIZE = None
+  if callable(_PREV_SIGWINCH):
+    _PREV_SIGWINCH(signum, frame)
+  return
+
+
+def _watch_terminal_size():
+  """
+  Installs _on_sigwinch if the platform supports it. Returns True if resizes
+  will be reported to us (so the terminal size may safely be cached).
+  """
+  global _SIGWINCH_WATCHED, _PREV_SIGWINCH
+  if not _SIGWINCH_WATCHED and hasattr(signal, "SIGWINCH"):
+    try:
+      _PREV_SIGWINCH = signal.signal(signal.SIGWINCH, _on_sigwinch)
+      _SIGWINCH_WATCHED = True
+    except ValueError: # Signals can only be set from the main thread
+      pass
+  return _SIGWINCH_WATCHED
+
+
+def terminal_size():
+  """
+  Returns the size of the terminal as a (columns, lines) tuple. The terminal
+  is only queried once and the result is reused until the terminal is resized
+  (SIGWINCH). On platforms without SIGWINCH, it is queried on every call.
+  When stdout is not a terminal, the size defaults to (80, 24).
+  """
+  global _TERMINAL_SIZE
+  if _TERMINAL_SIZE is not None:
+    return _TERMINAL_SIZE
+  size = tuple(shutil.get_terminal_size())
+  if _watch_terminal_size():
+    _TERMINAL_SIZE = size
+  return size
+
+
+def print2(*s, sep=" ", end="\n", file=sys.stdout, flush=True, n=None,
+           spaces=0):
   """
   Used as the default 'print' command anytime things are displayed in Menu. The
   main benefit of this function is that all output will be formatted so that
@@ -54,12 +106,13 @@ def print2(*s, sep=" ", end="\n", file=sys.stdout, flush=True, n=60, spaces=0):
     file: file object or file descriptor - Location to print to.
       default = sys.stdout (Standard output stream)
     n: int - The maximum length to format each line of text to.
-      default = 60
+      default = None (The width of the terminal)
     spaces: int: The number of spaces to place *before* each element in *s.
       default = 0
 
   Outputs: Returns None but writes whatever is inside *s to the specified file.
   """
+  n = terminal_size()[0] if n is None else n
   for m, obj in enumerate(s, 1):
     obj = str(obj) # In case it isn't already a string
     original_lines = obj.split("\n")
@@ -67,6 +120,9 @@ def print2(*s, sep=" ", end="\n", file=sys.stdout, flush=True, n=60, spaces=0):
     for line in original_lines:
       if line == "":
         output_lines += [""]
+      elif len(line) <= n-spaces and line.isprintable() \
+           and not line.endswith(" "):
+        output_lines.append(line) # Already fits; textwrap would not change it
       else:
         output_lines += textwrap.wrap(line, width=n-spaces)
     to_print = " "*spaces + ("\n" + " "*spaces).join(output_lines)
@@ -190,6 +246,7 @@ class Menu(object):
   handling project-specific flags from the Option class.
   """
   DEFAULT_OPTION_CLASS = Option
+  LAYOUT_CACHE_SIZE = 8 # Laid out frames to remember per menu (see layout)
   def __init__(self, header, options=None, splash="", 
                on_quit_message="", show_quit_at_toplevel=True):
     """
@@ -211,6 +268,8 @@ class Menu(object):
     self.header = header
     self.active_menu = self
     self.prev_menu = None
+    self._layout_cache = {} # (size, header, q_msg, option names) -> str
+    self._profiler = None # The MenuProfiler used by the running mainloop
     self.options = [] # This gets populated within add_option in the for loop
     options = [] if options is None else options
     for option in options:
@@ -226,18 +285,73 @@ class Menu(object):
     return
 
   def __str__(self):
-    out = ""
-    out += self.active_menu.header + "\n"
-    opt_str = "    {option_num:2d}. {option_name}\n"
-    q_str = "     q. {msg}\n"
-    for option_num, option in enumerate(self.active_menu.options, start=1):
-      out += opt_str.format(option_num=option_num, option_name=option.name)
     if self.active_menu.prev_menu is None:
-      if self.show_quit_at_toplevel: # Don't merge these two ifs!^
-        out += q_str.format(msg="Quit program")
+      q_msg = "Quit program" if self.show_quit_at_toplevel else None
     else:
-      out += q_str.format(msg="Previous menu")
-    return out
+      q_msg = "Previous menu"
+    return self.active_menu.layout(q_msg)
+
+  def layout(self, q_msg=None, size=None):
+    """
+    Returns this menu's header and options laid out for a terminal of the
+    given size. Options are listed one per line unless that would scroll off
+    the screen, in which case they are spread across as many columns as fit.
+    The result is cached per size, so redisplaying the menu (or resizing the
+    terminal back to a size it has already been) does not lay it out again.
+    The cache is keyed on the option names too, so editing self.options or
+    renaming an option in place is picked up on the next display.
+
+    Inputs:
+      q_msg: str - The description of the 'q' option. If None, no 'q' option
+             is displayed.
+      size: (int, int) - The (columns, lines) to lay the menu out for.
+        default = None (The size of the terminal)
+    """
+    size = terminal_size() if size is None else tuple(size)
+    names = tuple(str(option.name) for option in self.options)
+    key = (size, self.header, q_msg, names)
+    try:
+      return self._layout_cache[key]
+    except KeyError:
+      pass
+    if len(self._layout_cache) >= self.LAYOUT_CACHE_SIZE:
+      self._layout_cache.clear()
+    frame = self._layout_cache[key] = self._layout(q_msg, names, *size)
+    return frame
+
+  def forget_layout(self):
+    """ Discards any cached layouts, e.g. to free them or to time layout """
+    self._layout_cache.clear()
+    return
+
+  def _layout(self, q_msg, names, columns, lines):
+    """ Does the work for layout. Use layout instead, which caches this """
+    indent = "    "
+    gap = "  "
+    num_width = max(2, len(str(len(names))))
+    labels = [f"{n:{num_width}d}. {name}"
+              for n, name in enumerate(names, start=1)]
+    rows, n_cols, cell = len(labels), 1, 0
+    # Leave room for the header (as print2 will wrap it), the 'q' option, the
+    # two blank lines print2 ends the frame with, and the input prompt
+    header_lines = sum(len(textwrap.wrap(line, width=columns)) or 1
+                       for line in self.header.split("\n"))
+    used = header_lines + rows + (q_msg is not None) + 3
+    if labels and used > lines:
+      cell = max(map(len, labels)) + len(gap)
+      n_cols = max(1, (columns - len(indent) + len(gap)) // cell)
+      rows = -(-len(labels) // n_cols) # Ceiling division
+    out = [self.header]
+    if n_cols == 1:
+      out += [indent + label for label in labels]
+    else:
+      for row in range(rows):
+        cells = labels[row::rows]
+        out.append(indent + "".join(c.ljust(cell) for c in cells[:-1]) \
+                   + cells[-1])
+    if q_msg is not None:
+      out.append(indent + "q".rjust(num_width) + ". " + q_msg)
+    return "\n".join(out) + "\n"
 
   @property
   def valid_options(self):
@@ -260,19 +374,51 @@ class Menu(object):
       print2("$$ Invalid option! Try again.", spaces=2)
     return
 
-  def mainloop(self):
-    """ Activates the menu and handles user input """
+  def mainloop(self, profile=None, profile_options=None):
+    """
+    Activates the menu and handles user input.
+
+    Inputs:
+      profile: bool, str, or MenuProfiler - Whether to profile the session.
+               If True, a report is written to MenuProfiler.DEFAULT_PATH when
+               the mainloop exits. If a str, it is used as the path instead.
+               Pass a MenuProfiler to accumulate over several mainloops.
+        default = None (Profile if the PY_MENU_PROFILE variable is set)
+      profile_options: str or [str] - Only cProfile the actions of these options,
+                       given as option names or full option paths (see
+                       MenuProfiler). Everything else is only timed.
+        default = None (PY_MENU_PROFILE_OPTIONS if set, otherwise all)
+    """
+    prev_profiler = self._profiler
+    profiler = MenuProfiler.from_settings(profile, profile_options)
+    # Only the mainloop that starts a profiler writes its report. Mainloops
+    # nested inside of an action share the running profiler instead.
+    prev_active = MenuProfiler.active
+    owner = profiler is not None and profiler is not prev_active
+    if owner:
+      MenuProfiler.active = profiler
+    self._profiler = profiler
+    try:
+      return self._mainloop()
+    finally:
+      self._profiler = prev_profiler
+      if owner:
+        MenuProfiler.active = prev_active
+        profiler.write_report()
+
+  def _mainloop(self):
+    """ Does the work for mainloop """
     if not self._splash_shown:
       # In case something subclasses this Menu, there are sometimes cases where
       # the mainloop needs to be temporarily exitted from (from a custom
       # exception) and then restarted. In those cases, the mainloop may be
       # called several times. The splash message should not be displayed in
       # those cases.
-      clear_screen()
+      self._profiled("clear_screen", clear_screen)
       print2(self.splash)
       self._splash_shown = True
     while True:
-      print2(self)
+      self._profiled("render", print2, self)
       choice = self.get_choice()
       # Handle the special "q" cases
       if choice == "q":
@@ -309,7 +455,7 @@ class Menu(object):
         self.active_menu = action
       elif hasattr(action, "__call__"):
         try:
-          result = action.__call__()
+          result = self._profiled("action", action, choice=choice)
           if result == "break":
             # When a method returns 'break', we should exit the menu
             return
@@ -322,6 +468,41 @@ class Menu(object):
           any_key_to_continue()
     return
 
+  def menu_path(self, choice=None):
+    """
+    Returns the names leading from the toplevel menu to the active menu, and
+    to its option 'choice' (0-based) if given. The toplevel menu is named by
+    its header, every lower menu by the name of the option that leads to it.
+
+    The path follows prev_menu, which is the menu that last added it with
+    add_option. That is not always the route the operator took, so a menu
+    shared by several parents is always reported under the same one. If the
+    prev_menus form a cycle, the path stops at the first repeated menu.
+    """
+    path = []
+    if choice is not None:
+      path.append(str(self.get_option(choice).name))
+    menu = self.active_menu
+    visited = [menu]
+    while menu.prev_menu is not None and menu.prev_menu not in visited:
+      parent = menu.prev_menu
+      visited.append(parent)
+      for option in parent.options:
+        if option.action is menu:
+          path.append(str(option.name))
+          break
+      else:
+        path.append(menu.header)
+      menu = parent
+    path.append(menu.header)
+    return path[::-1]
+
+  def _profiled(self, kind, func, *args, choice=None):
+    """ Calls func(*args), through the active MenuProfiler if there is one """
+    if self._profiler is None:
+      return func(*args)
+    return self._profiler.call(kind, self.menu_path(choice), func, *args)
+
   def add_option(self, *args):
     """
     Can be used to dynamically add an option to the current menu. There are two
@@ -389,4 +570,130 @@ class Menu(object):
     """
     return self.get_option(choice).action
 
-  
\ No newline at end of file
+
+class MenuProfiler(object):
+  """
+  Collects timings for everything a Menu does in its mainloop so that slow
+  options can be tracked down. Every action, frame render, and screen clear
+  is timed, and the totals are kept per option path (the toplevel header
+  followed by the option names leading to it, joined by " > "). Actions of
+  the selected options are additionally run under cProfile.
+
+  Usually this is created by Menu.mainloop(profile=...) or by setting the
+  PY_MENU_PROFILE environment variable to 1 (or to the path to write to).
+  PY_MENU_PROFILE_OPTIONS may hold a comma separated list of the options to
+  run under cProfile.
+  """
+  ENV_VAR = "PY_MENU_PROFILE"
+  OPTIONS_ENV_VAR = "PY_MENU_PROFILE_OPTIONS"
+  DEFAULT_PATH = "py_menu_profile"
+  SEPARATOR = " > "
+  N_FUNCTIONS = 20 # Functions shown per option in the report
+  active = None # The MenuProfiler of the outermost profiled mainloop
+  _profiling = False # True while any MenuProfiler has cProfile running
+
+  def __init__(self, path=DEFAULT_PATH, options=None):
+    """
+    Inputs:
+      path: str - Where to write the report. The sorted text report is
+            written to path + ".txt" and the pstats dump to path + ".pstats"
+        default = MenuProfiler.DEFAULT_PATH
+      options: str or [str] - The option(s) whose actions should be run
+               under cProfile, as option names or full option paths.
+        default = None (All options)
+    """
+    self.path = path
+    if isinstance(options, str):
+      options = [options]
+    self.options = None if options is None else set(options)
+    self.timings = {} # (kind, path) -> [calls, total seconds, max seconds]
+    self.profiles = {} # path -> cProfile.Profile
+    return
+
+  @classmethod
+  def from_settings(cls, profile=None, options=None):
+    """
+    Builds a MenuProfiler from the arguments of Menu.mainloop, falling back
+    on the environment variables. If profile is None and a profiler is
+    already active (the mainloop is nested in a profiled action), returns
+    that one. Returns None if profiling is disabled.
+    """
+    if isinstance(profile, MenuProfiler):
+      return profile
+    if profile is None:
+      if cls.active is not None:
+        return cls.active
+      profile = os.environ.get(cls.ENV_VAR, "")
+    if profile in (False, "", "0"):
+      return None
+    if options is None and os.environ.get(cls.OPTIONS_ENV_VAR):
+      options = [option.strip() for option in \
+                 os.environ[cls.OPTIONS_ENV_VAR].split(",")]
+    path = cls.DEFAULT_PATH if profile in (True, "1") else str(profile)
+    return cls(path, options)
+
+  def wants(self, path):
+    """ Returns True if the action at path should be run under cProfile """
+    if self.options is None:
+      return True
+    return path[-1] in self.options or self.SEPARATOR.join(path) in self.options
+
+  def call(self, kind, path, func, *args):
+    """
+    Calls func(*args) and adds the time it took to the totals for (kind,
+    path). Actions of wanted options are also run under cProfile, unless
+    another profiler is already running (e.g. from a nested mainloop).
+    """
+    path = tuple(path)
+    use_cprofile = kind == "action" and not MenuProfiler._profiling \
+                   and self.wants(path)
+    start = time.perf_counter()
+    try:
+      if not use_cprofile:
+        return func(*args)
+      MenuProfiler._profiling = True
+      try:
+        profile = self.profiles.get(path)
+        if profile is None:
+          profile = self.profiles[path] = cProfile.Profile()
+        return profile.runcall(func, *args)
+      finally:
+        MenuProfiler._profiling = False
+    finally:
+      elapsed = time.perf_counter() - start
+      timing = self.timings.setdefault((kind, path), [0, 0.0, 0.0])
+      timing[0] += 1
+      timing[1] += elapsed
+      timing[2] = max(timing[2], elapsed)
+
+  def report(self):
+    """ Returns the report as a str, slowest (in total) first """
+    out = f"{'calls':>7} {'total s':>10} {'mean ms':>10} {'max ms':>10}  "\
+          f"{'kind':<12} path\n"
+    ordered = sorted(self.timings.items(), key=lambda item: -item[1][1])
+    for (kind, path), (calls, total, longest) in ordered:
+      out += f"{calls:7d} {total:10.4f} {1000*total/calls:10.3f} "\
+             f"{1000*longest:10.3f}  {kind:<12} {self.SEPARATOR.join(path)}\n"
+    for (kind, path), _timing in ordered:
+      if kind != "action" or path not in self.profiles:
+        continue
+      stream = io.StringIO()
+      stats = pstats.Stats(self.profiles[path], stream=stream)
+      stats.sort_stats("cumulative").print_stats(self.N_FUNCTIONS)
+      out += f"\n--- {self.SEPARATOR.join(path)} ---\n" + stream.getvalue()
+    return out
+
+  def write_report(self):
+    """
+    Writes the report to self.path + ".txt" and, if any actions were run
+    under cProfile, the combined stats to self.path + ".pstats" (load them
+    with pstats.Stats). Does nothing if nothing has been timed.
+    """
+    if not self.timings:
+      return
+    with open(self.path + ".txt", "w") as report_file:
+      report_file.write(self.report())
+    if self.profiles:
+      pstats.Stats(*self.profiles.values()).dump_stats(self.path + ".pstats")
+    print2(f"Profile report written to {self.path}.txt")
+    return
@@ -0,0 +1,56 @@
+"""
+This example measures how Menu lays out a very large menu. A menu with 1000
+options used to be printed one option per line, which scrolls the terminal a
+thousand lines every time the menu is displayed. Now, options are spread
+across as many columns as fit whenever a single column would not fit on the
+screen, and the laid out frame is cached until the menu or terminal changes.
+
+Run it with:
+  python -m py_menu.examples.layout_benchmark_example
+"""
+
+import timeit
+
+from py_menu import Menu
+
+N_OPTIONS = 1000
+REPEAT = 100
+
+big_menu = Menu(header="A very big menu")
+for n in range(1, N_OPTIONS + 1):
+  big_menu.add_option(f"Option {n}", lambda: None)
+
+
+def one_per_line(menu):
+  """ The layout used before multi-column menus (for comparison) """
+  out = menu.header + "\n"
+  for option_num, option in enumerate(menu.options, start=1):
+    out += f"    {option_num:2d}. {option.name}\n"
+  return out + "     q. Quit program\n"
+
+
+def uncached(menu, size):
+  """ Lays the menu out from scratch, as if it had never been displayed """
+  menu.forget_layout()
+  return menu.layout("Quit program", size)
+
+
+print(f"Menu with {N_OPTIONS} options, average of {REPEAT} renders\n")
+print(f"{'layout':<28}{'bytes':>8}{'lines':>8}{'usec':>10}")
+frame = one_per_line(big_menu)
+usec = timeit.timeit(lambda: one_per_line(big_menu), number=REPEAT)
+usec *= 1e6/REPEAT
+print(f"{'one per line':<28}{len(frame):>8}{frame.count(chr(10)):>8}"
+      f"{usec:>10.1f}")
+for size in [(80, 24), (120, 40), (200, 60)]:
+  frame = uncached(big_menu, size)
+  usec = timeit.timeit(lambda: uncached(big_menu, size), number=REPEAT)
+  usec *= 1e6/REPEAT
+  cached = timeit.timeit(lambda: big_menu.layout("Quit program", size),
+                         number=REPEAT)
+  cached *= 1e6/REPEAT
+  label = f"{size[0]}x{size[1]}"
+  print(f"{label + ' (uncached)':<28}{len(frame):>8}{frame.count(chr(10)):>8}"
+        f"{usec:>10.1f}")
+  print(f"{label + ' (cached)':<28}{len(frame):>8}{frame.count(chr(10)):>8}"
+        f"{cached:>10.1f}")